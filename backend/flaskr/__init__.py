@@ -22,6 +22,8 @@ def paginate_questions(request, selection):
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
+    if test_config:
+        app.config.update(test_config)
     setup_db(app)
 
     """
@@ -128,14 +130,21 @@ def create_app(test_config=None):
     @app.route("/questions", methods=["POST"])
     def create_question():
         data = request.get_json()
-        question = (data.get("question"),)
-        answer = (data.get("answer"),)
-        category = (data.get("category"),)
+        question = data.get("question")
+        answer = data.get("answer")
+        category = data.get("category")
         difficulty = data.get("difficulty")
 
         if not(question and answer and category and difficulty):
             abort(400)
 
+        # the frontend form submits these as strings
+        try:
+            category = int(category)
+            difficulty = int(difficulty)
+        except (TypeError, ValueError):
+            abort(400)
+
         try:
             question = Question(
                 question=question,
@@ -1,5 +1,6 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, create_engine, event
+from sqlalchemy.pool import StaticPool
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -7,18 +8,52 @@ database_path = os.environ.get('DATABASE_URI')
 
 db = SQLAlchemy()
 
+# set once the schema has been created, so repeated setup_db calls in one
+# process skip the per-table catalog round-trips of create_all()
+_schema_ready = False
+
+def _take_over_sqlite_transactions(engine):
+    '''Give SQLAlchemy full control of sqlite transactions.
+
+    pysqlite only emits BEGIN before DML, so Connection.begin() would
+    otherwise be a no-op and the test suite's outermost SAVEPOINT would
+    commit for real instead of joining the enclosing transaction.
+    '''
+    @event.listens_for(engine, "connect")
+    def _disable_implicit_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _emit_begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
 '''
 
 
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path, **engine_options):
+    global _schema_ready
+
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-    db.app = app
+    if database_path and database_path.startswith("sqlite"):
+        # share one connection so an in-memory database survives across
+        # create_all() and the requests made by the test client
+        engine_options.setdefault("poolclass", StaticPool)
+        engine_options.setdefault("connect_args", {"check_same_thread": False})
+    if engine_options:
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options
     db.init_app(app)
-    db.create_all()
+    if database_path and database_path.startswith("sqlite"):
+        with app.app_context():
+            _take_over_sqlite_transactions(db.engine)
+    if not _schema_ready:
+        with app.app_context():
+            db.create_all()
+        _schema_ready = True
 
 
 '''
@@ -33,7 +68,7 @@ class Question(db.Model):
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer)
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
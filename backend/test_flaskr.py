@@ -1,45 +1,160 @@
 import os
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
-from parameterized import parameterized
+from sqlalchemy import func, select
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+# An in-memory sqlite database keeps the suite free of Postgres round-trips;
+# export DATABASE_URI_TEST to run against a real server instead. The URI must
+# be in place before flaskr is imported because create_app reads it. Under
+# pytest-xdist (pytest -n auto) each worker process names its own in-memory
+# database so workers never contend for one schema.
+_WORKER = os.environ.get("PYTEST_XDIST_WORKER", "main")
+_DATABASE_URI = (
+    os.environ.get("DATABASE_URI_TEST")
+    or f"sqlite:///file:trivia_{_WORKER}?mode=memory&cache=shared&uri=true"
+)
+os.environ["DATABASE_URI"] = _DATABASE_URI
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import Question, Category, db
+
+
+# Request bodies that never vary between runs are serialized once here;
+# passing bytes also spares Werkzeug the str.encode per request.
+_VALID_QUESTION = {
+    "answer": "answer",
+    "question": "question",
+    "category": 1,
+    "difficulty": 1,
+}
+_VALID_QUESTION_BODY = json.dumps(_VALID_QUESTION).encode()
+_SEARCH_ARTHUR_BODY = json.dumps({"searchTerm": "arthur"}).encode()
+_SEARCH_DJANGO_BODY = json.dumps({"searchTerm": "django"}).encode()
+
+_APP = None
+
+
+def _get_app():
+    """Return the shared test app, building it on first use."""
+    global _APP
+    if _APP is None or not _APP.config.get("TESTING"):
+        # PROPAGATE_EXCEPTIONS stays off so the 4xx/5xx error handlers
+        # keep rendering responses instead of re-raising under TESTING.
+        _APP = create_app(
+            {"TESTING": True, "PROPAGATE_EXCEPTIONS": False}
+        )
+    return _APP
+
+
+def seed_db():
+    """Populate an empty database with a few known rows."""
+    if Category.query.count():
+        return
+
+    db.session.add_all(
+        [Category(type=type) for type in ("Science", "Art", "Geography")]
+    )
+    db.session.commit()
+
+    db.session.add_all(
+        [
+            Question(
+                question="What is the heaviest organ in the human body?",
+                answer="The Liver",
+                category=1,
+                difficulty=4,
+            ),
+            Question(
+                question="Who discovered penicillin?",
+                answer="Alexander Fleming",
+                category=1,
+                difficulty=3,
+            ),
+            Question(
+                question="What boxer's original name is Cassius Clay?",
+                answer="Muhammad Ali",
+                category=3,
+                difficulty=1,
+            ),
+            Question(
+                question="Which dung beetle was worshipped by the"
+                         " ancient Egyptians?",
+                answer="Scarab",
+                category=3,
+                difficulty=4,
+            ),
+        ]
+    )
+    db.session.commit()
 
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
+    HEADERS = {
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        """Build the app and schema once for the whole class."""
+        cls.app = _get_app()
+        cls.client = cls.app.test_client()
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+        seed_db()
+        # leave no open transaction on the shared connection before the
+        # per-test BEGIN issued by setUp
+        db.session.remove()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        cls.app_context.pop()
+
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client()
-        self.database_path = os.environ.get("DATABASE_URI")
-        setup_db(self.app, self.database_path)
-
-        self.headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-        }
-
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
+        """Wrap the test in a transaction that tearDown rolls back."""
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        self.num_questions = self.connection.scalar(
+            select(func.count(Question.id))
+        )
+        # Route all session work, including the commits issued by the
+        # request handlers, through savepoints on the held connection so
+        # the enclosing transaction can undo every insert and delete.
+        self._session = db.session
+        db.session = scoped_session(
+            sessionmaker(
+                bind=self.connection,
+                join_transaction_mode="create_savepoint",
+            )
+        )
 
     def tearDown(self):
         """Executed after reach test"""
-        pass
+        db.session.remove()
+        db.session = self._session
+        self.transaction.rollback()
+        self.connection.close()
+        # the rollback is what excuses tests from cleaning up their own
+        # fixture rows, so fail loudly if it ever stops holding
+        self.assertEqual(
+            db.session.scalar(select(func.count(Question.id))),
+            self.num_questions,
+            "test leaked Question rows past the rollback",
+        )
+        db.session.remove()
 
     def test_get_categories(self):
-        num_categories = Category.query.count()
+        num_categories = db.session.scalar(
+            select(func.count(Category.id))
+        )
 
         response = self.client.get("/categories")
 
-        data = json.loads(response.data.decode())
+        data = response.get_json()
         self.assertEqual(response.status_code, 200)
         self.assertTrue(isinstance(data["categories"], dict))
         self.assertEqual(len(data["categories"]), num_categories)
@@ -47,31 +162,33 @@ class TriviaTestCase(unittest.TestCase):
     def test_404_on_empty_results(self):
         response = self.client.get("/questions?page=100")
 
-        data = json.loads(response.data.decode())
+        data = response.get_json()
 
         self.assertEqual(response.status_code, 404)
         self.assertFalse(data["success"])
         self.assertEqual(data["message"], "Not Found")
 
     def test_get_questions(self):
-        num_questions = Question.query.count()
+        num_questions = db.session.scalar(
+            select(func.count(Question.id))
+        )
         response = self.client.get("/questions")
-        data = json.loads(response.data.decode())
+        data = response.get_json()
         self.assertEqual(response.status_code, 200)
         self.assertTrue(isinstance(data["questions"], list))
         self.assertEqual(data["total_questions"], num_questions)
 
     def test_delete_question_with_invalid_id(self):
         response = self.client.delete(f"/questions/0")
-        data = json.loads(response.data.decode())
+        data = response.get_json()
 
         self.assertEqual(response.status_code, 422)
         self.assertEqual(data["message"], "Unprocessible Entity")
 
     def test_delete_question(self):
-        question_id = Question.query.first().id
+        question_id = db.session.scalar(select(Question.id).limit(1))
         response = self.client.delete(f"/questions/{question_id}")
-        data = json.loads(response.data.decode())
+        data = response.get_json()
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(data["message"], "Question deleted successfully")
@@ -80,52 +197,52 @@ class TriviaTestCase(unittest.TestCase):
 
         self.assertEqual(deleted_question, None)
 
-    #
-    @parameterized.expand(
-        [
-            ["", "", "", ""],
-            ["answer", "", "", ""],
-            ["answer", "question", "", ""],
-            ["answer", "question", 1, ""],
-            # ["", "", "", 1],
-            ["answer", "question", "answer", "difficulty"],
-        ]
-    )
-    def test_create_question_with_invalid_data(
-        self, answer, question, category, difficulty
-    ):
-        question_input_data = {
-            "answer": answer,
-            "question": question,
-            "category": category,
-            "difficulty": difficulty,
-        }
-        response = self.client.post(
-            f"/questions",
-            data=json.dumps(question_input_data),
-            headers=self.headers,
-        )
-        data = json.loads(response.data.decode())
-
-        self.assertEqual(response.status_code, 400)
-        self.assertEqual(data["success"], False)
-        self.assertEqual(data["message"], "Bad Request")
-        self.assertEqual(data["error"], 400)
+    INVALID_QUESTION_CASES = [
+        ["", "", "", ""],
+        ["answer", "", "", ""],
+        ["answer", "question", "", ""],
+        ["answer", "question", 1, ""],
+        # ["", "", "", 1],
+        ["answer", "question", "answer", "difficulty"],
+    ]
+
+    def test_create_question_with_invalid_data(self):
+        for answer, question, category, difficulty in (
+            self.INVALID_QUESTION_CASES
+        ):
+            with self.subTest(
+                answer=answer,
+                question=question,
+                category=category,
+                difficulty=difficulty,
+            ):
+                question_input_data = {
+                    "answer": answer,
+                    "question": question,
+                    "category": category,
+                    "difficulty": difficulty,
+                }
+                response = self.client.post(
+                    f"/questions",
+                    data=json.dumps(question_input_data),
+                    headers=self.HEADERS,
+                )
+                data = response.get_json()
+
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(data["success"], False)
+                self.assertEqual(data["message"], "Bad Request")
+                self.assertEqual(data["error"], 400)
 
     def test_create_question_with_valid_data(self):
-        question_input_data = {
-            "answer": "answer",
-            "question": "question",
-            "category": 1,
-            "difficulty": 1,
-        }
+        question_input_data = _VALID_QUESTION
 
         response = self.client.post(
             f"/questions",
-            data=json.dumps(question_input_data),
-            headers=self.headers,
+            data=_VALID_QUESTION_BODY,
+            headers=self.HEADERS,
         )
-        data = json.loads(response.data.decode())
+        data = response.get_json()
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(data["success"], True)
@@ -143,82 +260,88 @@ class TriviaTestCase(unittest.TestCase):
     def test_search_question_which_does_not_exist(self):
         response = self.client.post(
             "/questions/search",
-            data=json.dumps({"searchTerm": "arthur"}),
-            headers=self.headers,
+            data=_SEARCH_ARTHUR_BODY,
+            headers=self.HEADERS,
         )
 
-        data = json.loads(response.data.decode())
+        data = response.get_json()
         self.assertEqual(response.status_code, 404)
         self.assertEqual(data["message"], "Not Found")
         self.assertFalse(data["success"])
 
     def test_search_question(self):
-        question1 = Question(
-            question="True or False: Django is a high-level Python Web"
-                     " framework that encourages rapid development"
-                     " and clean, pragmatic design",
-            answer="True",
-            difficulty=1,
-            category=1,
-        )
-        question2 = Question(
-            question="True or False: django is a micro web framework "
-                     "written in Python",
-            answer="False",
-            difficulty=1,
-            category=2,
+        # one INSERT..VALUES round-trip and one COMMIT for both fixtures
+        db.session.bulk_insert_mappings(
+            Question,
+            [
+                {
+                    "question": "True or False: Django is a high-level"
+                                " Python Web framework that encourages rapid"
+                                " development and clean, pragmatic design",
+                    "answer": "True",
+                    "difficulty": 1,
+                    "category": 1,
+                },
+                {
+                    "question": "True or False: django is a micro web"
+                                " framework written in Python",
+                    "answer": "False",
+                    "difficulty": 1,
+                    "category": 2,
+                },
+            ],
         )
-
-        question1.insert()
-        question2.insert()
+        db.session.commit()
 
         response = self.client.post(
             "/questions/search",
-            data=json.dumps({"searchTerm": "django"}),
-            headers=self.headers,
+            data=_SEARCH_DJANGO_BODY,
+            headers=self.HEADERS,
         )
 
-        data = json.loads(response.data.decode())
+        data = response.get_json()
         self.assertEqual(response.status_code, 200)
         self.assertTrue(data["success"])
         self.assertTrue(isinstance(data["questions"], list))
         self.assertEqual(data["total_questions"], 2)
 
-        question1.delete()
-        question2.delete()
-
     def test_get_question_by_category_with_invalid_category_id(self):
         response = self.client.get("categories/0/questions")
-        data = json.loads(response.data.decode())
+        data = response.get_json()
 
         self.assertEqual(response.status_code, 404)
         self.assertFalse(data["success"])
         self.assertEqual(data["message"], "Not Found")
 
     def test_get_question_by_category(self):
-        question1 = Question(
-            question="Is python a high level programming language",
-            answer="answer2",
-            difficulty=1,
-            category=2,
+        db.session.bulk_insert_mappings(
+            Question,
+            [
+                {
+                    "question": "Is python a high level programming language",
+                    "answer": "answer2",
+                    "difficulty": 1,
+                    "category": 2,
+                }
+            ],
         )
-        question1.insert()
+        db.session.commit()
 
         response = self.client.get("categories/2/questions")
-        data = json.loads(response.data.decode())
+        data = response.get_json()
 
-        num_questions = Question.query.filter_by(category=2).count()
+        num_questions = db.session.scalar(
+            select(func.count(Question.id)).where(Question.category == 2)
+        )
 
         self.assertEqual(response.status_code, 200)
         self.assertTrue(data["success"])
         self.assertEqual(data["total_questions"], num_questions)
         self.assertEqual(data["current_category"], 2)
 
-        question1.delete()
-
     def test_get_quizzes_only_returns_question_not_in_previous_question(self):
 
-        previous_questions = [question.id for question in Question.query.all()]
+        previous_questions = db.session.scalars(select(Question.id)).all()
 
         question1 = Question(
             question="Is python a high level programming language",
@@ -236,9 +359,9 @@ class TriviaTestCase(unittest.TestCase):
                     "quiz_category": {"id": "1"},
                 }
             ),
-            headers=self.headers,
+            headers=self.HEADERS,
         )
-        data = json.loads(response.data.decode())
+        data = response.get_json()
         question = data["question"]
 
         self.assertEqual(response.status_code, 200)
@@ -250,11 +373,9 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(question["category"], question1.category)
         self.assertEqual(question["category"], 1)
 
-        question1.delete()
-
     def test_405_return_on_method_not_allowed(self):
         response = self.client.patch("/questions")
-        data = json.loads(response.data.decode())
+        data = response.get_json()
 
         self.assertEqual(response.status_code, 405)
         self.assertFalse(data["success"])
@@ -264,9 +385,9 @@ class TriviaTestCase(unittest.TestCase):
         response = self.client.post(
             f"/questions",
             data=json.dumps(''),
-            headers=self.headers,
+            headers=self.HEADERS,
         )
-        data = json.loads(response.data.decode())
+        data = response.get_json()
 
         self.assertEqual(response.status_code, 500)
         self.assertFalse(data["success"])